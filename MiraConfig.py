@@ -0,0 +1,204 @@
+"""
+Connect to an Ovum heatpump via VNC and extract data from the Mira user interface.
+
+Check here for more details:
+https://github.com/Schneydr/Mira2mqtt
+
+@author Schneydr
+@date 2025/11/11
+"""
+
+import re
+import shlex
+
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True, slots=True)
+class RegionSpec:
+    """
+    Parsed configuration of a region. Optional settings are resolved to their
+    defaults and settings which may be given per key are resolved to one entry
+    per key, so processing a region does not need to inspect the configuration.
+    """
+
+    key: str
+    coordinates: tuple
+    target_height: int | None
+    pre_processing: tuple
+    threshold_mode: str
+    ocr_raw_first: bool
+    ocr_config: str
+    ocr_language: str | None
+    # Region key followed by the additional keys
+    keys: tuple
+    value_separators: re.Pattern
+    decpt: str | None
+    default_to_zero: bool
+    max_value: float | None
+    mandatory_decimal_places: int | None
+    mandatory_text: tuple
+    # One entry per key
+    units: tuple
+    device_classes: tuple
+    state_classes: tuple
+    value_templates: tuple
+
+
+@dataclass(frozen=True, slots=True)
+class PageSpec:
+    """
+    Parsed configuration of a page.
+    """
+
+    name: str
+    # Tuple of (x, y, mandatory text) per click, see parse_mouse_moves_and_clicks()
+    mouse_moves_and_clicks: tuple | None
+    regions: tuple
+    # Minimum time in seconds between two traversals of the page
+    refresh_interval: float | None
+
+
+def _as_tuple(value) -> tuple:
+    """
+    Return configuration value which may be a single value or a list as tuple.
+    """
+    if value is None:
+        return ()
+    if isinstance(value, (list, tuple)):
+        return tuple(value)
+    return (value,)
+# end _as_tuple()
+
+
+def _per_key(region_config: dict, name: str, count: int, default) -> tuple:
+    """
+    Resolve a setting given either for all keys or as list per key.
+    :param region_config: Region configuration
+    :param name: Name of the setting
+    :param count: Number of keys of the region
+    :param default: Value used if the setting or the entry for a key is missing
+    :return: Tuple with one value per key
+    """
+    if name not in region_config:
+        return (default,) * count
+
+    value = region_config[name]
+    if not isinstance(value, list):
+        return (value,) * count
+
+    return tuple(value[i] if i < len(value) else default for i in range(count))
+# end _per_key()
+
+
+def scaled_size(spec: RegionSpec) -> tuple | None:
+    """
+    Size of the region image scaled to its target height.
+    :param spec: Parsed region configuration
+    :return: Width and height or None, if the region is not scaled
+    """
+    x0, y0, x1, y1 = spec.coordinates
+    if spec.target_height is None or y1 <= y0:
+        return None
+
+    scale = spec.target_height / (y1 - y0)
+    # Scaling by less than 5% does not help tesseract
+    if 0.95 <= scale <= 1.05:
+        return None
+    return max(1, round((x1 - x0) * scale)), spec.target_height
+# end scaled_size()
+
+
+def parse_region(key: str, region_config: dict, target_height: int | None = None) -> RegionSpec:
+    """
+    Parse the configuration of a region.
+    :param key: Region key (unique identifier)
+    :param region_config: Region configuration
+    :param target_height: Default target height of the region image, None to not scale
+    :return: Parsed region configuration
+    """
+    keys = (key,) + _as_tuple(region_config.get('additionalKeys'))
+
+    # A character whitelist is passed to tesseract as config variable
+    ocr_config = region_config.get('ocrConfig', '')
+    if region_config.get('charWhitelist'):
+        ocr_config += f" -c tessedit_char_whitelist={shlex.quote(region_config['charWhitelist'])}"
+
+    return RegionSpec(
+        key=key,
+        coordinates=tuple(region_config['coordinates']),
+        target_height=region_config.get('targetHeight', target_height),
+        pre_processing=tuple(region_config.get('preProcessing', '').split('+')),
+        threshold_mode=region_config.get('thresholdMode', 'adaptive'),
+        ocr_raw_first=bool(region_config.get('ocrRawFirst', False)),
+        ocr_config=ocr_config,
+        ocr_language=region_config.get('ocrLanguage'),
+        keys=keys,
+        value_separators=re.compile(region_config.get('valueSeparators', r'\(')),
+        decpt=region_config.get('decpt'),
+        default_to_zero=bool(region_config.get('defaultToZero', False)),
+        max_value=region_config.get('maxValue'),
+        mandatory_decimal_places=region_config.get('mandatoryDecimalPlaces'),
+        mandatory_text=_as_tuple(region_config.get('MandatoryText')),
+        units=_per_key(region_config, 'unit', len(keys), 'None'),
+        device_classes=_per_key(region_config, 'deviceClass', len(keys), 'None'),
+        state_classes=_per_key(region_config, 'stateClass', len(keys), 'measurement'),
+        value_templates=_per_key(region_config, 'valueTemplate', len(keys), 'None'),
+    )
+# end parse_region()
+
+
+def parse_mandatory_text(mandatory_text) -> tuple | None:
+    """
+    Parse the mandatory texts of a page.
+    :param mandatory_text: List of strings or dictionaries with 'text' and
+                           optional 'coordinates', or None
+    :return: Tuple with one (text, coordinates) tuple per entry, coordinates
+             are None for the whole page. None, if no text is mandatory.
+    """
+    if mandatory_text is None:
+        return None
+
+    entries = []
+    for t in _as_tuple(mandatory_text):
+        if isinstance(t, dict):
+            coordinates = tuple(t['coordinates']) if 'coordinates' in t else None
+            entries.append((t['text'], coordinates))
+        else:
+            entries.append((t, None))
+    return tuple(entries)
+# end parse_mandatory_text()
+
+
+def parse_mouse_moves_and_clicks(moves: list | None) -> tuple | None:
+    """
+    Parse the mouse moves and clicks needed to access a page.
+    :param moves: List of dictionaries with 'moveTo' and optional 'MandatoryText'
+    :return: Tuple with one (x, y, mandatory text) tuple per click, see
+             parse_mandatory_text(). None, if the page needs no clicks.
+    """
+    if moves is None:
+        return None
+    return tuple((m['moveTo'][0], m['moveTo'][1], parse_mandatory_text(m.get('MandatoryText')))
+                 for m in moves)
+# end parse_mouse_moves_and_clicks()
+
+
+def parse_pages(config: dict) -> list[PageSpec]:
+    """
+    Parse the page and region configuration once at startup.
+    :param config: Configuration object
+    :return: List of parsed page configurations
+    """
+    pages = []
+    target_height = config.get('OCRTargetHeight')
+    for name, page_config in config['Pages'].items():
+        regions = tuple(parse_region(key, region_config, target_height)
+                        for key, region_config in page_config['Regions'].items())
+        pages.append(PageSpec(name=name,
+                              mouse_moves_and_clicks=parse_mouse_moves_and_clicks(
+                                  page_config.get('MouseMovesAndClicks')),
+                              regions=regions,
+                              refresh_interval=page_config.get('refreshInterval')))
+    return pages
+# end parse_pages()
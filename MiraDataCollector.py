@@ -9,44 +9,150 @@ https://github.com/Schneydr/Mira2mqtt
 """
 
 import datetime
-import locale
+import hashlib
 import logging
 import os
+import shlex
+import subprocess
+import threading
 import time
-import tempfile
 import cv2
-import pytesseract
+import numpy as np
 import json
-import paho.mqtt.client as mqtt
 
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from vncdotool import api
-from PIL import Image
-from MiraRegion import MiraRegion
+from MiraConfig import PageSpec, parse_pages, scaled_size
+from MiraRegion import MiraRegion, numeric_separators
+
+__all__ = ['MiraDataCollector', 'MiraPage']
+
+log = logging.getLogger(__name__)
+
+# The regions are OCRed in parallel threads, so tesseract's own OpenMP threads
+# would only oversubscribe the CPU. Must be set before libtesseract is loaded.
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+# tesserocr is optional, pytesseract is used if it is not installed
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+# xxhash is optional, blake2b is used if it is not installed
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+
+def _fast_hash(*parts: bytes) -> bytes:
+    """
+    Hash large buffers like screenshots, using xxh3 if available.
+    :param parts: Byte strings hashed as one
+    :return: 16 byte digest
+    """
+    h = xxhash.xxh3_128() if xxhash is not None else hashlib.blake2b(digest_size=16)
+    for part in parts:
+        h.update(part)
+    return h.digest()
+# end _fast_hash()
+
+
+def _parse_ocr_config(config: str) -> tuple:
+    """
+    Translate tesseract command line options into tesserocr API parameters.
+    :param config: tesseract configuration, e.g. '--oem 3 --psm 6 -c name=value'
+    :return: OCR engine mode, page segmentation mode and dictionary of variables
+    """
+    oem = 3   # OEM.DEFAULT
+    psm = 3   # PSM.AUTO
+    variables = {}
+
+    args = shlex.split(config)
+    for i in range(len(args) - 1):
+        if args[i] == '--oem':
+            oem = int(args[i + 1])
+        elif args[i] == '--psm':
+            psm = int(args[i + 1])
+        elif args[i] == '-c':
+            name, _, value = args[i + 1].partition('=')
+            variables[name] = value
+    return oem, psm, variables
+# end _parse_ocr_config()
+
+# Debug flag is read once when the module gets imported
+_DEBUG_IMAGE_WRITING = os.environ.get("DEBUG_IMAGE_WRITING") == "1"
 
 
 class MiraDataCollector:
-    DEBUG_OUTPUT = False
-    DEBUG_IMAGE_WRITING = False
+    DEBUG_IMAGE_WRITING = _DEBUG_IMAGE_WRITING
 
     hostname: str = None
     vncport: int = 5900
     vncclient: api = None
     config: dict = None
+    pages: list = None
     timestamp: datetime = None
     data: dict = None
     auto_discovery: list = None
 
     screenshot_path: str = None
-    mqtt_client: mqtt = None
+    mqtt_client = None
     mqtt_connection_etablished = False
     unacked_publish = None
 
     # MQTT defaults
     FIRST_RECONNECT_DELAY = 1
-    RECONNECT_RATE = 2
-    MAX_RECONNECT_COUNT = 12
     MAX_RECONNECT_DELAY = 60
-
+    # Maximum time in seconds to wait for a message to be published
+    PUBLISH_TIMEOUT = 10
+
+    # OCR result cache
+    OCR_CACHE_SIZE = 256
+    _ocr_cache: OrderedDict = None
+    # Identifies the OCR engine and models, results of others are not reused
+    _ocr_engine_id: bytes = None
+    _ocr_cache_lock: threading.Lock = None
+
+    # Worker threads running the OCR of the regions of a page
+    _ocr_pool: ThreadPoolExecutor = None
+
+    # Decimal point and thousands separator of the Mira UI locale
+    _decpt: str = None
+    _thou: str = None
+
+    # Persistent tesseract API handles (tesserocr), one set per thread
+    _use_tesserocr = False
+    _tess_local: threading.local = None
+    _tess_apis: list = None
+
+    # Last screenshot of each page and last values of each region, used
+    # to skip the OCR of regions which did not change
+    _prev_frames: dict = None
+    _last_region_values: dict = None
+
+    # Thumbnails of the regions at the time of their last OCR. A region whose
+    # thumbnail differs by less than the threshold (sum of absolute gray value
+    # differences) is treated as unchanged, which covers small VNC encoding
+    # artefacts. Set by 'RegionFingerprintThreshold', 0 disables the check.
+    REGION_FINGERPRINT_SIZE = (16, 16)
+    REGION_FINGERPRINT_THRESHOLD = 0
+    _region_fingerprints: dict = None
+
+    # Pair of images per region reused by the pre-processing of every cycle
+    _scratch_buffers: dict = None
+
+    # Time of the last traversal and the data and auto discovery messages of
+    # each page, used to skip pages within their refresh interval
+    _page_refreshed: dict = None
+    _page_results: dict = None
+
+    # Auto discovery messages are retained by the broker, so they are only
+    # published again if the set of sensors changes
+    _discovery_published = False
+    _discovery_hash: bytes = None
 
     def __init__(self, config: dict):
         """
@@ -54,141 +160,477 @@ class MiraDataCollector:
         :param config: Configuration object
         """
         self.config = config
+        self.pages = parse_pages(config)
 
         # Init data
         self.timestamp = datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
         self.data = {'Timestamp': self.timestamp}
         self.auto_discovery: list = []
+        self._ocr_cache = OrderedDict()
+        self._ocr_cache_lock = threading.Lock()
+        # Every worker thread loads its own language model, so only use a few
+        max_regions = max((len(page.regions) for page in self.pages), default=1)
+        self._ocr_pool = ThreadPoolExecutor(
+            max_workers=max(1, min(self.config.get('OCRThreads', 2), os.cpu_count() or 1, max_regions)))
+        self._prev_frames = {}
+        self._last_region_values = {}
+        self._region_fingerprints = {}
+        self.REGION_FINGERPRINT_THRESHOLD = self.config.get('RegionFingerprintThreshold', 0)
+        self._scratch_buffers = {}
+        self._page_refreshed = {}
+        self._page_results = {}
+        for page in self.pages:
+            for region_spec in page.regions:
+                x0, y0, x1, y1 = region_spec.coordinates
+                width, height = scaled_size(region_spec) or (x1 - x0, y1 - y0)
+                self._scratch_buffers[region_spec.key] = (np.empty((height, width), np.uint8),
+                                                          np.empty((height, width), np.uint8))
+        self._use_tesserocr = (tesserocr is not None
+                               and self.config.get('OCREngine', 'tesserocr') == 'tesserocr')
+        self._tess_local = threading.local()
+        self._tess_apis = []
+        if self._use_tesserocr:
+            engine = f"tesserocr {tesserocr.tesseract_version()}"
+        else:
+            engine = f"pytesseract {self.config.get('TesseractPath')}"
+        self._ocr_engine_id = f"{engine} {self.config.get('OCRDataDir')}".encode()
+        self._discovery_published = False
+        self._discovery_hash = None
+        self.init_numeric_separators()
         #self.config['autoDiscoveryTemplate']['stat_t'] = self.config['mqttStatusTopic']
-
-        if "DEBUG_OUTPUT" in os.environ and os.environ["DEBUG_OUTPUT"] == "1":
-            self.DEBUG_OUTPUT = True
-
-        if "DEBUG_IMAGE_WRITING" in os.environ and os.environ["DEBUG_IMAGE_WRITING"] == "1":
-            self.DEBUG_IMAGE_WRITING = True
     # end __init__()
 
+    def init_numeric_separators(self) -> None:
+        """
+        Determine decimal point and thousands separator of the locale configured
+        for the Mira UI once, so parsing values does not need to switch the process
+        wide locale.
+        """
+        self._decpt, self._thou = numeric_separators(self.config['locale'])
+    # end init_numeric_separators()
+
     def __enter__(self):
+        """
+        Connect to the MQTT broker and the heat pump.
+        :return: The collector
+        """
+        self.connect_mqtt()
+        self.load_ocr_cache()
         self.vnc_connect()
+        return self
     # end __enter__()
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         """
-        Destructor. Close existing VNC session.
+        Destructor. Close existing VNC session and MQTT connection and release
+        the OCR resources.
         :param exc_type:
         :param exc_val:
         :param exc_tb:
         :return:
         """
+        # Keep OCR results for the next run, even if closing a connection fails
+        self.save_ocr_cache()
+
         # Disconect from VNC
         if self.vncclient is not None:
-            self.vnc_disconnect()
-
-        # Disconnect from MQTT broker
-        self.mqtt_client.disconnect()
-        self.mqtt_client.loop_stop()
+            try:
+                self.vnc_disconnect()
+            except Exception as e:
+                log.warning("Closing VNC connection failed: %s", e)
+
+        # Disconnect from MQTT broker, not connected if MQTT is not used
+        if self.mqtt_client is not None:
+            self.mqtt_client.disconnect()
+            self.mqtt_client.loop_stop()
+
+        # Stop OCR worker threads and release the tesseract API handles
+        self._ocr_pool.shutdown()
+        self.close_ocr()
     # end __exit__()
 
+    def ocr_cache_path(self) -> str | None:
+        """
+        Path of the file set in 'OCRCacheFile'. A relative path is resolved
+        against the directory of the collector, not the working directory,
+        which differs when run by cron or as a service.
+        :return: Absolute path or None, if the cache file is disabled
+        """
+        cache_file = self.config.get('OCRCacheFile')
+        if cache_file is None:
+            return None
+        return os.path.join(os.path.dirname(os.path.abspath(__file__)), cache_file)
+    # end ocr_cache_path()
+
+    def load_ocr_cache(self) -> None:
+        """
+        Load OCR results of a previous run from the file set in 'OCRCacheFile'.
+        """
+        cache_file = self.ocr_cache_path()
+        if cache_file is None or not os.path.exists(cache_file):
+            return
+
+        try:
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+        except (OSError, ValueError) as e:
+            log.warning("Could not load OCR cache %s: %s", cache_file, e)
+            return
+
+        if not isinstance(cached, dict):
+            log.warning("Could not load OCR cache %s: unexpected content", cache_file)
+            return
+        self._ocr_cache.update((key, text) for key, text in cached.items()
+                               if isinstance(text, str))
+
+        while len(self._ocr_cache) > self.OCR_CACHE_SIZE:
+            self._ocr_cache.popitem(last=False)
+
+        log.debug("Loaded %i cached OCR results from %s", len(self._ocr_cache), cache_file)
+    # end load_ocr_cache()
+
+    def save_ocr_cache(self) -> None:
+        """
+        Store the OCR results to the file set in 'OCRCacheFile'.
+        """
+        cache_file = self.ocr_cache_path()
+        if cache_file is None:
+            return
+
+        with self._ocr_cache_lock:
+            cached = dict(self._ocr_cache)
+
+        # Replace the file at once, so a killed collector does not leave a
+        # truncated cache behind
+        try:
+            with open(cache_file + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(cached, f, ensure_ascii=False)
+            os.replace(cache_file + '.tmp', cache_file)
+        except OSError as e:
+            log.warning("Could not save OCR cache %s: %s", cache_file, e)
+    # end save_ocr_cache()
+
+    def _cached_ocr(self, img, lang: str, config: str = '') -> str:
+        """
+        Retrieve text from an image via tesseract. Results are cached by a hash of
+        the image bytes, so unchanged images are not passed to tesseract again.
+        :param img: PIL image or OpenCV image (numpy array)
+        :param lang: OCR language
+        :param config: tesseract configuration
+        :return: retrieved text
+        """
+        shape = getattr(img, 'shape', None) or img.size
+        key = _fast_hash(img.tobytes(), str(shape).encode(), lang.encode(), config.encode(),
+                         self._ocr_engine_id).hex()
+
+        # The cache is shared by the OCR worker threads
+        with self._ocr_cache_lock:
+            text = self._ocr_cache.get(key)
+            if text is not None:
+                self._ocr_cache.move_to_end(key)
+                return text
+
+        text = self._image_to_string(img, lang, config)
+
+        with self._ocr_cache_lock:
+            self._ocr_cache[key] = text
+            if len(self._ocr_cache) > self.OCR_CACHE_SIZE:
+                self._ocr_cache.popitem(last=False)
+        return text
+    # end _cached_ocr()
+
+    def _image_to_string(self, img, lang: str, config: str) -> str:
+        """
+        Retrieve text from an image, either via a persistent tesserocr API handle
+        or via pytesseract, which starts a tesseract process for every call.
+        :param img: PIL image or OpenCV image (numpy array)
+        :param lang: OCR language
+        :param config: tesseract configuration
+        :return: retrieved text
+        """
+        if not self._use_tesserocr:
+            data_dir = self.config.get('OCRDataDir')
+            if data_dir is not None:
+                config = f"--tessdata-dir {shlex.quote(data_dir)} {config}"
+            # Imported on first use, it is not needed with tesserocr
+            import pytesseract
+            if self.config.get('TesseractPath'):
+                pytesseract.pytesseract.tesseract_cmd = self.config['TesseractPath']
+            if isinstance(img, np.ndarray) and img.ndim == 2:
+                return self._run_tesseract(pytesseract.pytesseract.tesseract_cmd, img, lang, config)
+            return pytesseract.image_to_string(img, lang=lang, config=config)
+
+        tess_api = self._tesseract_api(lang, config)
+        if isinstance(img, np.ndarray):
+            height, width = img.shape[:2]
+            bytes_per_pixel = 1 if img.ndim == 2 else img.shape[2]
+            tess_api.SetImageBytes(img.tobytes(),
+                                   width, height, bytes_per_pixel, width * bytes_per_pixel)
+        else:
+            tess_api.SetImage(img)
+        return tess_api.GetUTF8Text()
+    # end _image_to_string()
+
+    @staticmethod
+    def _run_tesseract(tesseract_cmd: str, img: np.ndarray, lang: str, config: str) -> str:
+        """
+        Run the tesseract binary on a grayscale image passed via stdin. Unlike
+        pytesseract, no PNG temp files are written, the image is passed as
+        uncompressed PGM.
+        :param tesseract_cmd: Path of the tesseract binary
+        :param img: Grayscale OpenCV image (numpy array)
+        :param lang: OCR language
+        :param config: tesseract configuration
+        :return: retrieved text
+        """
+        import pytesseract
+
+        ok, encoded = cv2.imencode('.pgm', img)
+        if not ok:
+            raise pytesseract.TesseractError(-1, "Could not encode image")
+
+        cmd = [tesseract_cmd, 'stdin', 'stdout', '-l', lang] + shlex.split(config)
+        result = subprocess.run(cmd, input=encoded.tobytes(), capture_output=True)
+        if result.returncode != 0:
+            raise pytesseract.TesseractError(result.returncode,
+                                             result.stderr.decode('utf-8', errors='replace'))
+        return result.stdout.decode('utf-8')
+    # end _run_tesseract()
+
+    def _tesseract_api(self, lang: str, config: str):
+        """
+        Get the tesseract API handle of the current thread for the given language
+        and apply the given configuration. The handle is created on first use and
+        keeps the language model loaded for all further calls. Page segmentation
+        mode and variables are set per call, only the engine mode and variables
+        read while loading the model (load_*) need a handle of their own.
+        :param lang: OCR language
+        :param config: tesseract configuration
+        :return: tesserocr.PyTessBaseAPI
+        """
+        apis = getattr(self._tess_local, 'apis', None)
+        if apis is None:
+            apis = self._tess_local.apis = {}
+
+        oem, psm, variables = _parse_ocr_config(config)
+        init_variables = {name: value for name, value in variables.items()
+                          if name.startswith('load_')}
+        handle_key = (lang, oem, tuple(sorted(init_variables.items())))
+
+        entry = apis.get(handle_key)
+        if entry is None:
+            data_dir = self.config.get('OCRDataDir')
+            if data_dir is not None:
+                tess_api = tesserocr.PyTessBaseAPI(path=data_dir, lang=lang, oem=oem,
+                                                   variables=init_variables)
+            else:
+                tess_api = tesserocr.PyTessBaseAPI(lang=lang, oem=oem,
+                                                   variables=init_variables)
+            # Handle, configuration applied last and default values of the
+            # variables changed by a configuration
+            entry = apis[handle_key] = [tess_api, None, {}]
+            with self._ocr_cache_lock:
+                self._tess_apis.append(tess_api)
+
+        tess_api, applied_config, defaults = entry
+        if applied_config != config:
+            tess_api.SetPageSegMode(psm)
+            # Reset variables of the previous configuration
+            for name, value in defaults.items():
+                if name not in variables:
+                    tess_api.SetVariable(name, value)
+            for name, value in variables.items():
+                if name in init_variables:
+                    continue
+                if name not in defaults:
+                    default = tess_api.GetVariableAsString(name)
+                    if default is not None:
+                        defaults[name] = default
+                tess_api.SetVariable(name, value)
+            entry[1] = config
+        return tess_api
+    # end _tesseract_api()
+
+    def close_ocr(self) -> None:
+        """
+        Release all tesseract API handles.
+        """
+        with self._ocr_cache_lock:
+            for tess_api in self._tess_apis:
+                tess_api.End()
+            self._tess_apis.clear()
+    # end close_ocr()
+
     def connect_mqtt(self) -> None:
         if 'mqttUsage' in self.config and not self.config['mqttUsage']:
             return
 
-        print("Connect to MQTT Broker...")
+        log.info("Connect to MQTT Broker...")
         self.unacked_publish = set()
 
+        # Imported on first use, it is not needed if MQTT is disabled
+        import paho.mqtt.client as mqtt
+
         # Set Connecting Client ID
-        mqttc = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        # A fixed client id and a persistent session let the broker keep the
+        # session of the collector between reconnects
+        mqttc = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2,
+                            client_id=self.config.get('mqttClientId', ''),
+                            clean_session=not self.config.get('mqttClientId'))
+
+        # The network loop reconnects on its own, with an increasing delay
+        mqttc.reconnect_delay_set(min_delay=self.FIRST_RECONNECT_DELAY,
+                                  max_delay=self.MAX_RECONNECT_DELAY)
 
         # Connect
         mqttc.username_pw_set(self.config['mqttUser'], self.config['mqttPassword'])
         mqttc.connect(self.config['mqttBroker'], self.config['mqttPort'])
         mqttc.loop_start()
         self.mqtt_client = mqttc
-        print("Connected to MQTT Broker!")
+        log.info("Connected to MQTT Broker!")
     # end connect_mqtt()
 
-    def on_disconnect(self, userdata, rc):
-        logging.info("Disconnected with result code: %s", rc)
-        reconnect_count, reconnect_delay = 0, self.FIRST_RECONNECT_DELAY
-        while reconnect_count < self.MAX_RECONNECT_COUNT:
-            logging.info("Reconnecting in %d seconds...", reconnect_delay)
-            time.sleep(reconnect_delay)
-
-            try:
-                self.mqtt_client.reconnect()
-                logging.info("Reconnected successfully!")
-                return
-            except Exception as err:
-                logging.error("%s. Reconnect failed. Retrying...", err)
-
-            reconnect_delay *= self.RECONNECT_RATE
-            reconnect_delay = min(reconnect_delay, self.MAX_RECONNECT_DELAY)
-            reconnect_count += 1
-        logging.info("Reconnect failed after %s attempts. Exiting...", reconnect_count)
-    # end on_disconnect()
-
-    def mqtt_publish(self, topic: str, message: str, retain: bool = False):
+    def mqtt_publish(self, topic: str, message: str, retain: bool = False, wait: bool = True,
+                     qos: int = 1):
+        """
+        Publish a message to the MQTT broker.
+        :param topic: MQTT topic
+        :param message: Message payload
+        :param retain: Let the broker retain the message
+        :param qos: MQTT quality of service level
+        :param wait: Wait for the acknowledgement of the broker, otherwise the
+                     caller has to wait for the returned message info
+        :return: Message info or None, if MQTT is not used or the message could
+                 not be published, e.g. while the client is disconnected
+        """
         if 'mqttUsage' in self.config and not self.config['mqttUsage']:
-            return
+            return None
 
         # Publish message
-        if retain:
-            msg_info = self.mqtt_client.publish(topic, message, qos=1, retain=True)
-        else:
-            msg_info = self.mqtt_client.publish(topic, message, qos=1)
-        self.unacked_publish.add(msg_info.mid)
-        msg_info.wait_for_publish()
+        msg_info = self.mqtt_client.publish(topic, message, qos=qos, retain=retain)
+        if msg_info.rc != 0:
+            log.warning("Could not publish to %s, MQTT error code %s", topic, msg_info.rc)
+            return None
+        if qos > 0:
+            self.unacked_publish.add(msg_info.mid)
+        if wait and not self.wait_for_publish(msg_info):
+            return None
+        return msg_info
     # end mqtt_publish()
 
+    def wait_for_publish(self, msg_info) -> bool:
+        """
+        Wait until a message was sent (QoS 0) or acknowledged by the broker,
+        at most PUBLISH_TIMEOUT seconds.
+        :param msg_info: Message info returned by mqtt_publish()
+        :return: True, if the message was published in time
+        """
+        if msg_info is None:
+            return False
+
+        try:
+            msg_info.wait_for_publish(self.PUBLISH_TIMEOUT)
+        except (RuntimeError, ValueError) as e:
+            log.warning("MQTT publish failed: %s", e)
+            return False
+
+        if not msg_info.is_published():
+            log.warning("MQTT message %s not published within %ss", msg_info.mid, self.PUBLISH_TIMEOUT)
+            return False
+        self.unacked_publish.discard(msg_info.mid)
+        return True
+    # end wait_for_publish()
+
     def publish_data(self):
-        # Set locale for parsing localized values
-        locale.setlocale(locale.LC_ALL, self.config['locale'])
+        # Messages are sent without waiting for each acknowledgement, so the
+        # round trips to the broker overlap
+        pending = []
+
+        # Forget messages of previous cycles which were never acknowledged,
+        # so the set does not grow while the collector keeps running
+        if self.unacked_publish is not None:
+            self.unacked_publish.clear()
 
-        # Publish auto discovery message
+        # Publish auto discovery message once, or again if the sensors changed
+        discovery_hash = None
         if self.config['mqttAutoDiscovery']:
-            if self.DEBUG_OUTPUT:
-                print("Number of auto discovery messages: %i" % len(self.auto_discovery))
+            discovery_hash = _fast_hash(json.dumps(self.auto_discovery, sort_keys=True).encode())
+            if discovery_hash != self._discovery_hash:
+                self._discovery_published = False
+
+        if self.config['mqttAutoDiscovery'] and not self._discovery_published:
+            debug_output = log.isEnabledFor(logging.DEBUG)
+            log.debug("Number of auto discovery messages: %i", len(self.auto_discovery))
             for i in range(len(self.auto_discovery)):
-                if self.DEBUG_OUTPUT:
-                    print("-------- AUTO DISCOVERY COMPONENT --------")
-                    print(json.dumps(self.auto_discovery[i]))
+                if debug_output:
+                    log.debug("-------- AUTO DISCOVERY COMPONENT --------")
+                    log.debug(json.dumps(self.auto_discovery[i]))
 
                 topic: str = self.config['mqttAutoDiscoveryTopic']
                 name: str = self.auto_discovery[i]['name']
                 topic = topic.replace('%s', name)
-                if self.DEBUG_OUTPUT:
-                    print(f"Setting sensor name '{name}' to topic name -> '{topic}'")
+                log.debug("Setting sensor name '%s' to topic name -> '%s'", name, topic)
 
                 # Publish auto discover message
-                self.mqtt_publish(topic,
-                                  json.dumps(self.auto_discovery[i]),
-                                  True)
-            if self.DEBUG_OUTPUT:
-                print("------------------------------------------")
-
-        # Publish data
-        self.mqtt_publish(self.config['mqttStatusTopic'],
-                          json.dumps(self.data))
-        if self.DEBUG_OUTPUT:
-            print(f"State messages published to {self.config['mqttStatusTopic']}")
+                pending.append(self.mqtt_publish(topic,
+                                                 json.dumps(self.auto_discovery[i], separators=(',', ':')),
+                                                 True, wait=False))
+            log.debug("------------------------------------------")
+
+        # Publish data. The state is overwritten by the next cycle anyway, so
+        # it is sent with QoS 0 and no acknowledgement of the broker is needed.
+        # Waiting for it only waits until it has been written to the socket.
+        pending.append(self.mqtt_publish(self.config['mqttStatusTopic'],
+                                         json.dumps(self.data, separators=(',', ':')),
+                                         wait=False, qos=0))
+
+        # Wait for all acknowledgements. A failed message does not abort the
+        # cycle, auto discovery is then published again in the next one.
+        published = True
+        for msg_info in pending:
+            if not self.wait_for_publish(msg_info):
+                published = False
+
+        if discovery_hash is not None and published:
+            self._discovery_published = True
+            self._discovery_hash = discovery_hash
+
+        log.debug("State messages published to %s", self.config['mqttStatusTopic'])
     # end publish_data()
 
     def vnc_connect(self) -> None:
         # Establish VNC connection
         connection_target = (self.config['OvumHostname'] + '::'
                              + str(self.config['OvumVNCPort']))
-        print(f"Connecting to your heat pump on {connection_target}...")
+        log.info("Connecting to your heat pump on %s...", connection_target)
 
         self.vncclient = api.connect(connection_target)
         time.sleep(1)
     # end vnc_connect()
 
+    def vnc_reconnect(self) -> None:
+        """
+        Re-establish the VNC connection, e.g. after the heat pump dropped it.
+        The vncdotool reactor keeps running, as it can not be restarted.
+        """
+        try:
+            self.vncclient.disconnect()
+        except Exception as e:
+            log.warning("Closing VNC connection failed: %s", e)
+        self.vnc_connect()
+    # end vnc_reconnect()
+
     def vnc_disconnect(self) -> None:
         self.vncclient.disconnect()
         api.shutdown()
     # end vnc_disconnect()
 
     def traverse_pages(self) -> None:
+        # Start with fresh data, the collector may be used for several cycles
+        self.timestamp = datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
+        self.data = {'Timestamp': self.timestamp}
+        self.auto_discovery = []
+
         # First move the mouse to wake up the display
         self.vncclient.mouseMove(100, 100)
         time.sleep(0.5)
@@ -196,161 +638,374 @@ class MiraDataCollector:
         mira_pages=[]
 
         # Traverse all pages and make screenshots
-        for page, page_config in self.config['Pages'].items():
-            print("Processing page %s..." % page)
+        for page in self.pages:
+            now = time.monotonic()
+            if (page.refresh_interval is not None and page.name in self._page_results
+                    and now - self._page_refreshed[page.name] < page.refresh_interval):
+                log.info("Skipping page %s, its data is still up to date", page.name)
+                continue
+
+            log.info("Processing page %s...", page.name)
             mira_page = MiraPage(self, page)
 
-            if page_config['MouseMovesAndClicks'] is not None:
-                mandatory_found = mira_page.do_mouse_moves_and_click(page_config['MouseMovesAndClicks'])
+            if page.mouse_moves_and_clicks is not None:
+                mandatory_found = mira_page.do_mouse_moves_and_click(page.mouse_moves_and_clicks)
                 if not mandatory_found:
+                    # Do not publish outdated values of a page which could not be reached
+                    self._page_results.pop(page.name, None)
                     continue
 
             mira_page.take_screenshot()
             mira_pages.append(mira_page)
 
+        # Return to the home page, the screenshots of all pages are taken
+        back_home = self.config.get('BackHomeClick')
+        if back_home is not None:
+            self.vncclient.mouseMove(back_home[0], back_home[1])
+            self.vncclient.mousePress(1)
+
         # Travers all pages a second time to process their regions
         for mira_page in mira_pages:
             mira_page.process_regions()
-            self.data.update(mira_page.data)
-
-            # Assemble auto discovery messages
-            for ad_message in mira_page.auto_discovery:
+            self._page_results[mira_page.name] = (mira_page.data, mira_page.auto_discovery)
+            self._page_refreshed[mira_page.name] = time.monotonic()
+
+        # Assemble data and auto discovery messages in page order, skipped pages
+        # contribute the results of their last traversal
+        for page in self.pages:
+            if page.name not in self._page_results:
+                continue
+            data, auto_discovery = self._page_results[page.name]
+            self.data.update(data)
+            for ad_message in auto_discovery:
                 self.auto_discovery.append(ad_message)
 
-        print("\nExtracted values:")
-        for k, v in self.data.items():
-            print(f"{k}: {v}")
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("\nExtracted values:")
+            for k, v in self.data.items():
+                log.debug("%s: %s", k, v)
 
         # Publish data
         self.publish_data()
     # end traverse_pages()
 
-class MiraPage(MiraDataCollector):
+    def poll(self, interval: float | None = None) -> None:
+        """
+        Traverse the pages once or repeatedly. The VNC session and the MQTT
+        connection stay open between the cycles.
+        :param interval: Time in seconds between the start of two cycles,
+                         None to traverse the pages only once
+        """
+        reconnect = False
+        while True:
+            started = time.monotonic()
+            try:
+                # The VNC session may be broken after a failed cycle
+                if reconnect:
+                    self.vnc_reconnect()
+                    reconnect = False
+                self.traverse_pages()
+            except Exception:
+                if interval is None:
+                    raise
+                # Keep running, the MQTT client reconnects on its own
+                log.exception("Cycle failed, retrying in %s seconds", interval)
+                reconnect = True
+
+            if interval is None:
+                return
+
+            # Keep the OCR results in case the collector gets killed
+            self.save_ocr_cache()
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
+    # end poll()
+
+class MiraPage:
     """
     A page in the Mira user interface.
     """
 
-    DEBUG_OUTPUT = True
-    DEBUG_IMAGE_WRITING = True
+    DEBUG_IMAGE_WRITING = False
 
+    collector: MiraDataCollector = None
+    vncclient: api = None
+    config: dict = None
+    data: dict = None
+    auto_discovery: list = None
+    spec: PageSpec = None
     name: str = None
     pil_image = None
+    frame: np.ndarray = None
+    gray: np.ndarray = None
     img: cv2 = None
     screenshot_path: str = None
+    dirty_rects: list = None
 
-    def __init__(self, mira: MiraDataCollector, name: str):
+    def __init__(self, mira: MiraDataCollector, spec: PageSpec):
         """
         Constructor.
-        :param name: Page name
+        :param mira: Data collector owning the VNC connection, OCR cache and worker threads
+        :param spec: Parsed page configuration
         """
 
-        super().__init__(mira.config)
+        self.collector = mira
         self.vncclient = mira.vncclient
         self.config = mira.config
-        self.name = name
+        self.spec = spec
+        self.name = spec.name
+        self.data = {}
         self.auto_discovery = []
-
-        if "DEBUG_OUTPUT" in os.environ and os.environ["DEBUG_OUTPUT"] == "1":
-            self.DEBUG_OUTPUT = True
-
-        if "DEBUG_IMAGE_WRITING" in os.environ and os.environ["DEBUG_IMAGE_WRITING"] == "1":
-            self.DEBUG_IMAGE_WRITING = True
+        self.DEBUG_IMAGE_WRITING = mira.DEBUG_IMAGE_WRITING
     # end __init__()
 
     def take_screenshot(self) -> None:
         self.vncclient.refreshScreen()
 
-        # Capture screen to memory
-        temp_file = tempfile.NamedTemporaryFile(suffix='.png', delete=False)
-        temp_filename = temp_file.name
-        temp_file.close()
-        try:
-            self.vncclient.captureScreen(temp_filename)
-            self.pil_image = Image.open(temp_filename)
+        # Use the framebuffer of the VNC client directly, the copy keeps
+        # the image stable while the client receives further updates
+        self.pil_image = self.vncclient.screen.copy()
 
-            if 'DebugKeepScreenshots' in self.config and self.config['DebugKeepScreenshots']:
-                timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                self.screenshot_path = self.name + f"screenshot_{timestamp}.png"
-                self.pil_image.save(self.screenshot_path, "PNG")
+        # Convert the screenshot to grayscale once, the regions are cropped from it.
+        # PIL images are RGB, not BGR like images loaded by OpenCV.
+        self.frame = np.asarray(self.pil_image)
+        self.gray = cv2.cvtColor(self.frame, cv2.COLOR_RGB2GRAY)
 
-                if self.DEBUG_OUTPUT:
-                    print(f"Screenshot stored: {self.screenshot_path}")
+        if 'DebugKeepScreenshots' in self.config and self.config['DebugKeepScreenshots']:
+            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+            self.screenshot_path = self.name + f"screenshot_{timestamp}.png"
+            try:
+                self.pil_image.save(self.screenshot_path, "PNG")
+            except OSError as e:
+                log.error("An error ocurred: %s", e)
+                return
 
-        except Exception as e:
-            print(f"An error ocurred: {e}")
-        finally:
-            if os.path.exists(temp_filename):
-                os.remove(temp_filename)
+            log.debug("Screenshot stored: %s", self.screenshot_path)
     # end take_screenshot()
 
-    def check_mandatory_content(self, mandatory_text: list[str]) -> bool:
-        # Check, if mandatory text can be found in page
+    def check_mandatory_content(self, mandatory_text: tuple) -> bool:
+        """
+        Check, if mandatory text can be found in page.
+        :param mandatory_text: Tuple of (text, coordinates) tuples, the coordinates
+                               (x/y top left and x/y bottom right) are the area of
+                               the page the text is shown in or None for the whole page.
+        :return: True, if all texts were found
+        """
         # Abort, if not present
         if mandatory_text is not None:
-            if self.DEBUG_OUTPUT:
-                print ("Checking for mandatory texts: %s" % ('+'.join(mandatory_text)))
-            #image = Image.open(self.screenshot_path)
-            #text = pytesseract.image_to_string(image, self.config['OCRLanguage'])
-            text = pytesseract.image_to_string(self.pil_image, self.config['OCRLanguage'])
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("Checking for mandatory texts: %s",
+                          '+'.join(t for t, coordinates in mandatory_text))
+
+            # Retrieved text by area, None is the whole page. Only retrieve
+            # the areas we need, small areas are much faster to recognize.
+            texts = {}
+            for t, coordinates in mandatory_text:
+                if coordinates not in texts:
+                    # Run the OCR in a worker thread, which already has the
+                    # language model loaded
+                    if coordinates is None:
+                        texts[coordinates] = self.collector._ocr_pool.submit(
+                            self.collector._cached_ocr, self.pil_image,
+                            self.config['OCRLanguage']).result()
+                    else:
+                        texts[coordinates] = self.collector._ocr_pool.submit(
+                            self.collector._cached_ocr, self.pil_image.crop(coordinates),
+                            self.config['OCRLanguage'], '--psm 7').result()
+                text = texts[coordinates]
 
-            for t in mandatory_text:
                 if t not in text:
-                    print("%s not found in page %s" % (t, self.name))
-                    if self.DEBUG_OUTPUT:
-                        print (f"Raw page text content: '{text}'")
+                    log.info("%s not found in page %s", t, self.name)
+                    log.debug("Raw page text content: '%s'", text)
                     return False
         return True
     # end check_mandatory_content()
 
-    def do_mouse_moves_and_click(self, move_definition: list) -> bool:
-        for m in move_definition:
+    def _screen_hash(self) -> bytes:
+        """
+        Receive the current screen and compute a hash of it.
+        :return: Hash of the screen
+        """
+        self.vncclient.refreshScreen()
+        return _fast_hash(self.vncclient.screen.tobytes())
+    # end _screen_hash()
+
+    def _wait_for_stable_frame(self, before: bytes, min_delay: float = 0.5,
+                               timeout: float = 2.0, interval: float = 0.05) -> None:
+        """
+        Wait until the page was redrawn after a click. Returns as soon as the screen
+        differs from the one before the click and the same frame was then received
+        three times in a row. If the screen does not change, e.g. because the page
+        was already shown, it returns once the same frame was received three times
+        in a row and at least min_delay passed. Returns after the timeout at the latest.
+        :param before: Hash of the screen before the click
+        :param min_delay: Minimum time to wait in seconds, if the screen did not change
+        :param timeout: Maximum time to wait in seconds
+        :param interval: Time between two frames in seconds
+        """
+        prev = None
+        same_frames = 0
+        changed = False
+        start = time.monotonic()
+        while time.monotonic() - start < timeout:
+            h = self._screen_hash()
+            if h != before:
+                changed = True
+            same_frames = same_frames + 1 if h == prev else 1
+            prev = h
+            if same_frames >= 3 and (changed or time.monotonic() - start >= min_delay):
+                return
+            time.sleep(interval)
+    # end _wait_for_stable_frame()
+
+    def do_mouse_moves_and_click(self, move_definition: tuple) -> bool:
+        for x, y, mandatory_text in move_definition:
             # Move mouse to coordinates and click
-            self.vncclient.mouseMove(m['moveTo'][0],
-                                     m['moveTo'][1])
+            self.vncclient.mouseMove(x, y)
             time.sleep(0.5)
+            before = self._screen_hash()
             self.vncclient.mousePress(1)
-            time.sleep(0.5)
+            self._wait_for_stable_frame(before)
 
             self.take_screenshot()
 
-            if 'MandatoryText' not in m or m['MandatoryText'] is None:
+            if mandatory_text is None:
                 return True
 
             # Check if mandatory text exists
-            mandatory_found = self.check_mandatory_content(m['MandatoryText'])
+            mandatory_found = self.check_mandatory_content(mandatory_text)
 
             if not mandatory_found:
-                print("Mandatory text [%s] not found in page!" % m['MandatoryText'] )
+                log.info("Mandatory text [%s] not found in page!",
+                         ', '.join(t for t, coordinates in mandatory_text))
                 return False
         return True
     # end do_mouse_moves_and_click()
 
-    def process_regions(self) -> None:
-        page_config = self.config['Pages'][self.name]
+    def find_dirty_rects(self, curr: np.ndarray) -> list | None:
+        """
+        Determine the rectangles of the page which changed since the page
+        was processed the last time.
+        :param curr: Current screenshot of the page
+        :return: List of rectangles (x/y top left and x/y bottom right) or None,
+                 if there is no previous screenshot of the page
+        """
+        prev = self.collector._prev_frames.get(self.name)
+        if prev is None or prev.shape != curr.shape:
+            return None
+
+        diff = curr != prev
+        if diff.ndim == 3:
+            diff = np.any(diff, axis=2)
+
+        contours, _ = cv2.findContours(diff.astype(np.uint8),
+                                       cv2.RETR_EXTERNAL,
+                                       cv2.CHAIN_APPROX_SIMPLE)
+        dirty_rects = []
+        for contour in contours:
+            x, y, w, h = cv2.boundingRect(contour)
+            dirty_rects.append((x, y, x + w, y + h))
+        return dirty_rects
+    # end find_dirty_rects()
+
+    def is_region_dirty(self, coordinates: tuple) -> bool:
+        """
+        Check, if a region intersects with one of the changed rectangles of the page.
+        :param coordinates: x/y top left and x/y bottom right of the region
+        :return: True, if the region changed or there is no previous screenshot
+        """
+        if self.dirty_rects is None:
+            return True
+
+        x0, y0, x1, y1 = coordinates
+        for dx0, dy0, dx1, dy1 in self.dirty_rects:
+            if dx0 < x1 and dx1 > x0 and dy0 < y1 and dy1 > y0:
+                return True
+        return False
+    # end is_region_dirty()
+
+    def region_fingerprint(self, region: MiraRegion) -> np.ndarray:
+        """
+        Compute a small thumbnail of the region used to detect changes.
+        :param region: Region of the current screenshot
+        :return: Thumbnail as signed integer array
+        """
+        thumb = cv2.resize(region.img, self.collector.REGION_FINGERPRINT_SIZE,
+                           interpolation=cv2.INTER_AREA)
+        return thumb.astype(np.int16)
+    # end region_fingerprint()
+
+    def is_region_similar(self, key: str, fingerprint: np.ndarray) -> bool:
+        """
+        Compare the fingerprint of a region with the one of its last OCR.
+        :param key: Region key
+        :param fingerprint: Current fingerprint of the region
+        :return: True, if the region differs less than the threshold
+        """
+        prev = self.collector._region_fingerprints.get(key)
+        if prev is None or prev.shape != fingerprint.shape:
+            return False
+        return int(np.abs(fingerprint - prev).sum()) < self.collector.REGION_FINGERPRINT_THRESHOLD
+    # end is_region_similar()
 
+    def process_regions(self) -> None:
         # Load image with OpenCV and then Pillow
         #img = cv2.imread(self.screenshot_path)
         #image = Image.fromarray(img)
         # Load image from class instance
-        image = self.pil_image
-
-        # Loop over all regions of current page
-        regions = page_config['Regions']
-        for key, region_config in regions.items():
-            if self.DEBUG_OUTPUT:
-                print("Processing region %s..." % key)
-
-            region: MiraRegion = MiraRegion(key,
-                                            region_config,
-                                            image,
+        frame = self.frame
+        self.dirty_rects = self.find_dirty_rects(frame)
+
+        # Loop over all regions of current page and run their pre-processing
+        # and OCR in the worker threads. Tesseract runs outside the GIL, so the
+        # regions are processed in parallel.
+        regions = []
+        for region_spec in self.spec.regions:
+            key = region_spec.key
+            log.debug("Processing region %s...", key)
+
+            region: MiraRegion = MiraRegion(region_spec,
+                                            self.gray,
                                             self.config['OCRLanguage'],
-                                            self.config['locale'])
+                                            self.config['locale'],
+                                            self.collector._cached_ocr,
+                                            (self.collector._decpt, self.collector._thou),
+                                            self.collector._scratch_buffers.get(key))
 
             if ('DebugDeleteImageAfterSuccess' in self.config
                 and self.config['DebugDeleteImageAfterSuccess']):
                 region.set_debug_delete_image_after_success(True)
 
-            self.data.update(region.process_numeric_values())
+            # Skip the OCR if the pixels of the region did not change
+            known = key in self.collector._last_region_values
+            if known and not self.is_region_dirty(region_spec.coordinates):
+                log.debug("... region %s unchanged, reusing previous values", key)
+                regions.append((region, None, None))
+                continue
+
+            # Optionally skip the OCR as well if the region is nearly identical
+            # to the one of its last OCR. The fingerprint is taken before the
+            # pre-processing replaces the image of the region.
+            fingerprint = None
+            if self.collector.REGION_FINGERPRINT_THRESHOLD > 0:
+                fingerprint = self.region_fingerprint(region)
+            if known and fingerprint is not None and self.is_region_similar(key, fingerprint):
+                log.debug("... region %s similar, reusing previous values", key)
+                regions.append((region, None, None))
+                continue
+
+            regions.append((region,
+                            self.collector._ocr_pool.submit(region.process_and_retrieve),
+                            fingerprint))
+
+        # Parse the retrieved texts in the order of the configuration
+        for region, future, fingerprint in regions:
+            if future is None:
+                values = self.collector._last_region_values[region.key]
+            else:
+                values = region.process_numeric_values(future.result())
+                self.collector._last_region_values[region.key] = values
+                self.collector._region_fingerprints[region.key] = fingerprint
+            self.data.update(values)
 
             # Append auto discovery message for every key in curent region
             if self.config['mqttAutoDiscovery']:
@@ -368,3 +1023,6 @@ class MiraPage(MiraDataCollector):
                     discovery_message['val_tpl'] = dm_part['val_tpl']
 
                     self.auto_discovery.append(discovery_message)
+
+        # Keep the screenshot to detect changes the next time
+        self.collector._prev_frames[self.name] = frame
@@ -9,21 +9,91 @@ https://github.com/Schneydr/Mira2mqtt
 """
 
 import datetime
+import functools
 import locale
-import glob
+import logging
 import os
 import re
+import threading
 import cv2
 import numpy as np
-import pytesseract
+
+from MiraConfig import RegionSpec, scaled_size
+
+log = logging.getLogger(__name__)
+
+# Units of numeric values and the multiplier converting them to the published unit
+_UNIT_RE = re.compile(r'\s*(kWh|MWh|kW|W|°C|%|rps)$')
+_UNIT_MUL = {'kWh': 1, 'MWh': 1000, 'kW': 1000, 'W': 1, '°C': 1, '%': 1, 'rps': 1}
+
+# Values with unit in the retrieved texts
+_TEMP_RE = re.compile(r"(-?\d{1,2},?\d)\s*°C")
+_ENERGY_RE = re.compile(r"(-?\d+[.,]?\d*)\s*(kWh|kwh|Kwh|KWh|kKWh|mwh|Mwh|MWh)")
+_POWER_RE = re.compile(r"(-?\d+[.,]?\d*)\s*(w|W|kW|kw|KW|kkW|kKW)")
+_BATTERY_RE = re.compile(r"(\d{1,3})\s*\%")
+_RPS_RE = re.compile(r"(\d{1,3})\s*rps")
+
+# Patterns in the order they are tried, with the kind of value and its unit.
+# Energy and power values carry their unit in the second group.
+_VALUE_PATTERNS = ((_TEMP_RE, 'temperature', '°C'),
+                   (_BATTERY_RE, 'battery', '%'),
+                   (_RPS_RE, 'RPS', 'rps'),
+                   (_ENERGY_RE, 'energy', None),
+                   (_POWER_RE, 'power', None))
+
+# Corrections of upper/lower case errors in recognized units
+_UNIT_FIX = {'kwh': 'kWh', 'Kwh': 'kWh', 'KWh': 'kWh', 'kKWh': 'kWh', 'mwh': 'MWh', 'Mwh': 'MWh',
+             'w': 'W', 'kw': 'kW', 'KW': 'kW', 'kkW': 'kW', 'kKW': 'kW'}
+
+# Corrections of wrongly recognized digits
+_DIGIT_FIX = str.maketrans({'A': '4', 'B': '8', 'D': '0', 'I': '1', 'T': '7', 'ı': ' '})
+
+# Debug flag is evaluated once when the module gets imported
+_DEBUG_IMAGE_WRITING = os.environ.get("DEBUG_IMAGE_WRITING") == "1"
+
+# File extension of debug images. BMP files are written much faster than PNG.
+_DEBUG_IMAGE_EXT = '.' + os.environ.get("DEBUG_IMAGE_FORMAT", "png")
+
+# Decimal point and thousands separator per locale. The locale is process
+# wide, so switching it is serialized.
+_separators: dict = {}
+_separators_lock = threading.Lock()
+
+
+def numeric_separators(ui_locale: str) -> tuple:
+    """
+    Determine decimal point and thousands separator of a locale. The locale is
+    only switched the first time a locale is requested.
+    :param ui_locale: Locale for numbers shown in UI
+    :return: Decimal point and thousands separator
+    """
+    with _separators_lock:
+        separators = _separators.get(ui_locale)
+        if separators is not None:
+            return separators
+
+        previous_locale = locale.setlocale(locale.LC_NUMERIC)
+        try:
+            locale.setlocale(locale.LC_NUMERIC, ui_locale)
+            conventions = locale.localeconv()
+            separators = (conventions['decimal_point'], conventions['thousands_sep'])
+        except locale.Error as e:
+            log.error("Error setting locale to %s: %s", ui_locale, e)
+            separators = ('.', '')
+        finally:
+            locale.setlocale(locale.LC_NUMERIC, previous_locale)
+
+        _separators[ui_locale] = separators
+        return separators
+# end numeric_separators()
+
 
 class MiraRegion:
     """
     A region in the Mira user interface used for retrieving values via OCR.
     """
 
-    DEBUG_OUTPUT = False
-    DEBUG_IMAGE_WRITING = False
+    DEBUG_IMAGE_WRITING = _DEBUG_IMAGE_WRITING
 
     key: str = None
     img: cv2 = None
@@ -32,76 +102,149 @@ class MiraRegion:
     real_decpt = None
     real_thpt = None
     decpt = None
-    img_prefix = None
-    regionConfig = None
+    _img_prefix = None
+    debug_images: list = None
+    spec: RegionSpec = None
     default_to_zero = False
     value_separators = None
+    ocr_function = None
+    scratch_buffers: tuple = None
+    _scratch_index = 0
+    pre_processing_steps: list = None
 
     DebugDeleteImageAfterSuccess = True
 
     def __init__(self,
-                 key: str,
-                 region_config: dict,
-                 img: 'cv2',
+                 spec: RegionSpec,
+                 img: np.ndarray,
                  language: str,
-                 ui_locale: str):
+                 ui_locale: str,
+                 ocr_function=None,
+                 numeric_separators: tuple = None,
+                 scratch_buffers: tuple = None):
         """
         Constructor of a MiraRegion.
-        :param key: Region key (unique identifier)
-        :param region_config: Region confg
-        :param img: Mira UI screenshot
+        :param spec: Parsed region configuration
+        :param img: Grayscale Mira UI screenshot
         :param language: OCR language
         :param ui_locale: Locale for numbers shown in UI
+        :param ocr_function: Optional function(img, lang, config) used instead of
+                             calling tesseract directly, e.g. for caching
+        :param numeric_separators: Optional decimal point and thousands separator of
+                                   ui_locale, determined from the locale if not given
+        :param scratch_buffers: Optional pair of images with the size of the region,
+                                used alternately as output of the pre-processing steps
         """
 
-        if "DEBUG_OUTPUT" in os.environ and os.environ["DEBUG_OUTPUT"] == "1":
-            self.DEBUG_OUTPUT = True
-
-        if "DEBUG_IMAGE_WRITING" in os.environ and os.environ["DEBUG_IMAGE_WRITING"] == "1":
-            self.DEBUG_IMAGE_WRITING = True
-
-        # Crop and grey scale image from given coordinates
-        self.key = key
-        self.regionConfig = region_config
-        self.img = cv2.cvtColor(np.array(img.crop(region_config['coordinates'])),
-                                cv2.COLOR_BGR2GRAY)
+        # Crop image from given coordinates. This is a view on the screenshot,
+        # the pre-processing steps never write into it.
+        self.key = spec.key
+        self.spec = spec
+        x0, y0, x1, y1 = spec.coordinates
+        self.img = img[y0:y1, x0:x1]
         self.language = language
         self.ui_locale = ui_locale
-        self.decpt = region_config['decpt'] if 'decpt' in region_config else None
-        self.default_to_zero = True if 'defaultToZero' in region_config and region_config['defaultToZero'] else False
-        self.value_separators = region_config['valueSeparators'] if 'valueSeparators' in region_config else '\('
+        self.ocr_function = ocr_function
+        self.decpt = spec.decpt
+        self.default_to_zero = spec.default_to_zero
+        self.value_separators = spec.value_separators
+        self.scratch_buffers = scratch_buffers
+        self._scratch_index = 0
+
+        # Resolve the pre-processing steps once, unknown names are ignored.
+        # A thresholding step followed by 'invert' is done in one pass.
+        names = [pp for pp in spec.pre_processing if pp in self.PRE_PROCESSING_STEPS]
+        self.pre_processing_steps = []
+        i = 0
+        while i < len(names):
+            pair = tuple(names[i:i + 2])
+            if pair in self.FUSED_PRE_PROCESSING_STEPS:
+                self.pre_processing_steps.append(('+'.join(pair), self.FUSED_PRE_PROCESSING_STEPS[pair]))
+                i += 2
+            else:
+                self.pre_processing_steps.append((names[i], self.PRE_PROCESSING_STEPS[names[i]]))
+                i += 1
 
         #cv2.imwrite("processed-" + pp + "-" + self.key + ".png", self.img)
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
-        self.img_prefix = f'processed-{key}-{timestamp}-'
+        self._img_prefix = None
+        self.debug_images = []
 
         # Set correct decimal point and thousands separators in case of parsing errors
-        self.set_numeric_separators()
+        if numeric_separators is not None:
+            self.real_decpt, self.real_thpt = numeric_separators
+        else:
+            self.set_numeric_separators()
+
+    @property
+    def img_prefix(self) -> str:
+        """
+        File name prefix of the debug images, created on first use so the
+        timestamp is only formatted if debug images are written.
+        """
+        if self._img_prefix is None:
+            timestamp = datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
+            self._img_prefix = f'processed-{self.key}-{timestamp}-'
+        return self._img_prefix
 
     def set_debug_delete_image_after_success(self, flag: bool) -> None:
         self.DebugDeleteImageAfterSuccess = flag
 
+    def next_buffer(self) -> np.ndarray | None:
+        """
+        Return the scratch buffer for the output of the next pre-processing step.
+        The buffers are used alternately, so the output of a step never is its input.
+        :return: Scratch buffer or None, if OpenCV shall allocate a new image
+        """
+        if self.scratch_buffers is None:
+            return None
+
+        buffer = self.scratch_buffers[self._scratch_index]
+        self._scratch_index ^= 1
+        return buffer
+
+    def scale_to_target_height(self) -> None:
+        """
+        Pre-processing of image: Scale the image to the target height of the region,
+        tesseract works best with a text height of about 30 to 40 pixels.
+        """
+        size = scaled_size(self.spec)
+        if size is None:
+            return
+
+        interpolation = cv2.INTER_CUBIC if size[1] > self.img.shape[0] else cv2.INTER_AREA
+        self.img = cv2.resize(self.img, size, dst=self.next_buffer(), interpolation=interpolation)
+
     def enhance_contrast(self) -> None:
         """
         Pre-processing of image: Enhance contrast.
         :return:
         """
 
-        # call addWeighted function. use beta = 0 to effectively only operate on one image
-        #                                   contrast           brightness
-        self.img = cv2.addWeighted(self.img, 3, self.img, 0, 0)
+        # Scale the gray values by 3, saturated to 255. Same result as
+        # addWeighted(img, 3, img, 0, 0), but reads the image only once.
+        #                                             contrast  brightness
+        self.img = cv2.convertScaleAbs(self.img, alpha=3, beta=0, dst=self.next_buffer())
 
-    def adaptive_thresholding(self) -> None:
+    def adaptive_thresholding(self, threshold_type: int = cv2.THRESH_BINARY) -> None:
         """
         Pre-processing of image: Adaptive Thresholding (better for changing backgrounds).
+        With threshold mode 'otsu' a global threshold is used instead, which is
+        much cheaper and sufficient for regions with a uniform background.
+        :param threshold_type: THRESH_BINARY_INV to invert the result in the same pass
         """
 
+        if self.spec.threshold_mode == 'otsu':
+            ret, self.img = cv2.threshold(self.img, 0, 255, threshold_type + cv2.THRESH_OTSU,
+                                          dst=self.next_buffer())
+            return
+
         self.img = cv2.adaptiveThreshold(
             self.img, 255,
             cv2.ADAPTIVE_THRESH_MEAN_C,  # ADAPTIVE_THRESH_MEAN_C or ADAPTIVE_THRESH_GAUSSIAN_C
-            cv2.THRESH_BINARY,
-            11, 2
+            threshold_type,
+            11, 2,
             # 11, 2
+            dst=self.next_buffer()
         )
 
     def invert(self) -> None:
@@ -109,28 +252,28 @@ class MiraRegion:
         Pre-processing of image: Invert the image. Use if the text is bright.
         """
 
-        self.img = cv2.bitwise_not(self.img)
+        self.img = cv2.bitwise_not(self.img, dst=self.next_buffer())
 
-    def image_smoothen(self) -> None:
+    def image_smoothen(self, threshold_type: int = cv2.THRESH_BINARY) -> None:
         """
         Pre-processing of image: Smooth the image for improving accuracy of OCR.
         Based on code by Trenton McKinney:
         https://trenton3983.github.io/posts/ocr-image-processing-pytesseract-cv2/
+        :param threshold_type: THRESH_BINARY_INV to invert the result in the same pass
         """
 
-        # Step 1: Apply binary thresholding to the input image
-        ret1, th1 = cv2.threshold(self.img, 88, 255, cv2.THRESH_BINARY)
+        # All steps after the first one work in place on its output.
+        # Step 1: Apply binary thresholding to the input image. Otsu's thresholding
+        # of the result, as in the original code, would not change a binary image.
+        ret1, th1 = cv2.threshold(self.img, 88, 255, cv2.THRESH_BINARY, dst=self.next_buffer())
 
-        # Step 2: Apply Otsu's thresholding to further enhance the binary image
-        ret2, th2 = cv2.threshold(th1, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        # Step 2: Perform Gaussian blurring to reduce noise
+        blur = cv2.GaussianBlur(th1, (5, 5), 0, dst=th1)
 
-        # Step 3: Perform Gaussian blurring to reduce noise
-        blur = cv2.GaussianBlur(th2, (5, 5), 0)
+        # Step 3: Apply Otsu's thresholding to obtain the final smoothed image
+        ret2, th2 = cv2.threshold(blur, 0, 255, threshold_type + cv2.THRESH_OTSU, dst=blur)
 
-        # Step 4: Apply another Otsu's thresholding to obtain the final smoothed image
-        ret3, th3 = cv2.threshold(blur, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-
-        self.img = th3
+        self.img = th2
         return
     # end image_smoothen()
 
@@ -141,27 +284,37 @@ class MiraRegion:
         https://trenton3983.github.io/posts/ocr-image-processing-pytesseract-cv2/
         """
 
-        # Apply adaptive thresholding to filter out noise and enhance text visibility
-        filtered = cv2.adaptiveThreshold(self.img, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, 9, 41)
-
-        # Define a kernel for morphological operations (erosion and dilation)
-        kernel = np.ones((1, 1), np.uint8)
-
-        # Perform morphological opening to remove small noise regions
-        opening = cv2.morphologyEx(filtered, cv2.MORPH_OPEN, kernel)
+        # Apply adaptive thresholding to filter out noise and enhance text visibility.
+        # The original code opened and closed the result with a 1x1 kernel, which
+        # does not change an image, so the morphological operations were dropped.
+        filtered = cv2.adaptiveThreshold(self.img, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, 9, 41,
+                                         dst=self.next_buffer())
 
-        # Perform morphological closing to fill gaps in text regions
-        closing = cv2.morphologyEx(opening, cv2.MORPH_CLOSE, kernel)
-
-        # Further smoothen the image using a custom function (image_smoothen)
+        # Further smoothen the image using a custom function (image_smoothen).
+        # It writes into the other scratch buffer, so filtered is kept.
         self.image_smoothen()
 
-        # Combine the smoothened image with the closing result using bitwise OR
-        self.img = cv2.bitwise_or(self.img, closing)
+        # Combine the smoothened image with the filtered one using bitwise OR
+        self.img = cv2.bitwise_or(self.img, filtered, dst=self.img)
 
         return
     # end remove_noise_and_smooth()
 
+    # Pre-processing steps by their name in the configuration
+    PRE_PROCESSING_STEPS = {
+        'contrast': enhance_contrast,
+        'denoise': remove_noise_and_smooth,
+        'smooth': image_smoothen,
+        'thresh': adaptive_thresholding,
+        'invert': invert,
+    }
+
+    # Steps followed by 'invert' which can produce the inverted result directly
+    FUSED_PRE_PROCESSING_STEPS = {
+        ('thresh', 'invert'): functools.partial(adaptive_thresholding, threshold_type=cv2.THRESH_BINARY_INV),
+        ('smooth', 'invert'): functools.partial(image_smoothen, threshold_type=cv2.THRESH_BINARY_INV),
+    }
+
     def write_file(self, file_name: str) -> None:
         """
         Writes the region image to a file. Useful for debugging
@@ -169,76 +322,80 @@ class MiraRegion:
         """
         cv2.imwrite(file_name, self.img)
 
+    def write_debug_image(self, step: str) -> None:
+        """
+        Writes the region image after a pre-processing step to a debug file and
+        remembers it for the cleanup after success.
+        :param step: Name of the pre-processing step
+        """
+        file_name = f"{self.img_prefix}{step}{_DEBUG_IMAGE_EXT}"
+        self.write_file(file_name)
+        self.debug_images.append(file_name)
+
     def retrieve_text(self) -> str:
         """
         Retrieve text from region image.
         :return: retrieved text
         """
-        ocr_language = self.regionConfig['ocrLanguage'] if 'ocrLanguage' in self.regionConfig else self.language
+        ocr_language = self.spec.ocr_language if self.spec.ocr_language is not None else self.language
 
+        if self.ocr_function is not None:
+            return self.ocr_function(self.img, ocr_language, self.spec.ocr_config)
+
+        # Imported on first use, it is not needed with an OCR function
+        import pytesseract
         return pytesseract.image_to_string(self.img,
                                            lang=ocr_language,
-                                           config=self.regionConfig['ocrConfig'])
+                                           config=self.spec.ocr_config)
 
     def process_and_retrieve(self) -> str:
         """
         Pre-processes and then retrieves text from a Mira UI region.
         :return: Retrieved text
         """
-        pre_processing = self.regionConfig['preProcessing']
-
-        # grayscale the image
-        if self.DEBUG_IMAGE_WRITING:
-            cv2.imwrite(f"{self.img_prefix}gray.png", self.img)
-
-        if self.DEBUG_OUTPUT:
-            print (f"Pre-processing region {self.key} image for: {pre_processing}...")
-        for pp in pre_processing.split("+"):
-            if pp == "contrast":
-                self.enhance_contrast()
-            elif pp == "denoise":
-                self.remove_noise_and_smooth()
-            elif pp == "smooth":
-                self.image_smoothen()
-            if pp == "thresh":
-                self.adaptive_thresholding()
-            if pp == "invert":
-                self.invert()
-
-            # For debugging write processed image to file and print out retrived text
-            if self.DEBUG_IMAGE_WRITING:
-                cv2.imwrite(f"{self.img_prefix}{pp}.png", self.img)
-            if self.DEBUG_OUTPUT:
-                print ("... retrieved text after %s pre-processing: '%s'" % (pp, self.retrieve_text().strip()))
-
-        return self.retrieve_text().strip()
+        debug_output = log.isEnabledFor(logging.DEBUG)
+        debug_image_writing = self.DEBUG_IMAGE_WRITING
+
+        # grayscale (and optionally scaled) image
+        self.scale_to_target_height()
+        if debug_image_writing:
+            self.write_debug_image('gray')
+
+        # Optionally try the grayscale image first and skip the pre-processing,
+        # if a value can already be recognized
+        if self.spec.ocr_raw_first and self.pre_processing_steps:
+            text = self.retrieve_text().strip()
+            corrected_text = text.translate(_DIGIT_FIX)
+            if any(pattern.search(corrected_text) for pattern, kind, unit in _VALUE_PATTERNS):
+                if debug_output:
+                    log.debug("... retrieved value without pre-processing for region %s: '%s'",
+                              self.key, text)
+                return text
+
+        if debug_output:
+            log.debug("Pre-processing region %s image for: %s...",
+                      self.key, '+'.join(self.spec.pre_processing))
+        last_text = None
+        for pp, step in self.pre_processing_steps:
+            step(self)
+
+            # For debugging write processed image to file and print out retrived text.
+            # Without debugging, only the pre-processing runs in the loop.
+            if debug_image_writing:
+                self.write_debug_image(pp)
+            if debug_output:
+                last_text = self.retrieve_text().strip()
+                log.debug("... retrieved text after %s pre-processing: '%s'", pp, last_text)
+
+        # The text of the last step is already known in debug mode
+        return last_text if last_text is not None else self.retrieve_text().strip()
     # end process_and_retrieve()
 
     def set_numeric_separators(self) -> None:
         """
-            Sets the locale and returns the decimal point character.
+            Sets the decimal point and thousands separator of the UI locale.
         """
-        try:
-            # Set the locale for numeric formatting
-            locale.setlocale(locale.LC_NUMERIC, self.ui_locale)
-
-            # Get the locale conventions
-            settings = locale.localeconv()
-
-            # Extract the decimal point character
-            self.real_decpt = settings['decimal_point']
-            self.real_thpt = settings['thousands_sep']
-
-            #if self.DEBUG_OUTPUT:
-            #    print(f"... decimal point = {self.real_decpt} - thousands seperator = {self.real_thpt}")
-
-        except locale.Error as e:
-            print(f"Error setting locale to {self.ui_locale}: {e}")
-            return None
-        finally:
-            # reset the locale
-            locale.setlocale(locale.LC_NUMERIC, locale.getdefaultlocale())
-            pass
+        self.real_decpt, self.real_thpt = numeric_separators(self.ui_locale)
     # end set_numeric_separators()
 
     def clean_numeric_separators(self, value: str) -> str:
@@ -255,18 +412,19 @@ class MiraRegion:
         return ret_value
 
     def get_numeric_value(self, strvalue: str) -> float:
-        # Set locale for parsing localized values
-        locale.setlocale(locale.LC_ALL, self.ui_locale)
-
         numvalue: float = 0.0
 
+        # Parse localized value like locale.atof(), but with the separators
+        # determined in advance instead of switching the process wide locale
+        if self.real_thpt:
+            strvalue = strvalue.replace(self.real_thpt, '')
+        if self.real_decpt:
+            strvalue = strvalue.replace(self.real_decpt, '.')
+
         try:
-            numvalue = locale.atof(strvalue)
+            numvalue = float(strvalue)
         except ValueError:
-            print(f"... ERROR: could not get numeric value for {strvalue}")
-        finally:
-            # reset the locale
-            locale.setlocale(locale.LC_NUMERIC, locale.getdefaultlocale())
+            log.warning("... could not get numeric value for %s", strvalue)
 
         return numvalue
     # end get_only_numeric_value()
@@ -275,50 +433,29 @@ class MiraRegion:
         # Cleanup and parse numeric data before publishing
         strvalue = self.clean_numeric_separators(value.strip())
         numvalue = None
-        if str(strvalue).endswith("kWh"):
-            strvalue = str(strvalue).removesuffix("kWh")
-            numvalue = self.get_numeric_value(strvalue)
-        elif str(strvalue).endswith("MWh"):
-            strvalue = str(strvalue).removesuffix("MWh")
-            numvalue = self.get_numeric_value(strvalue)
-            numvalue *= 1000
-        elif str(strvalue).endswith("kW"):
-            strvalue = str(strvalue).removesuffix("kW")
-            numvalue = self.get_numeric_value(strvalue)
-            numvalue *= 1000
-        elif str(strvalue).endswith("W"):
-            strvalue = str(strvalue).removesuffix("W")
-            numvalue = self.get_numeric_value(strvalue)
-        elif str(strvalue).endswith("°C"):
-            strvalue = str(strvalue).removesuffix("°C")
-            numvalue = self.get_numeric_value(strvalue)
-        elif str(strvalue).endswith("%"):
-            strvalue = str(strvalue).removesuffix("%")
-            numvalue = self.get_numeric_value(strvalue)
-        elif str(strvalue).endswith("rps"):
-            strvalue = str(strvalue).removesuffix("rps")
-            numvalue = self.get_numeric_value(strvalue)
+        match = _UNIT_RE.search(strvalue)
+        if match:
+            strvalue = strvalue[:match.start()]
+            numvalue = self.get_numeric_value(strvalue) * _UNIT_MUL[match.group(1)]
 
         if numvalue is not None:
-            if 'maxValue' in self.regionConfig:
-                while numvalue > self.regionConfig['maxValue']:
+            if self.spec.max_value is not None:
+                while numvalue > self.spec.max_value:
                     numvalue /= 10
 
-            if 'mandatoryDecimalPlaces' in self.regionConfig:
+            if self.spec.mandatory_decimal_places is not None:
                 decimals = strvalue.split(self.real_decpt)
 
                 # We don't have decimals after the dot
                 if len(decimals) <= 1:
-                    print('... number needed decimal fixing')
-                    numvalue /= pow(10, self.regionConfig['mandatoryDecimalPlaces'])
+                    log.debug('... number needed decimal fixing')
+                    numvalue /= pow(10, self.spec.mandatory_decimal_places)
 
             strvalue = str(numvalue)
 
-            if self.DEBUG_OUTPUT:
-                print(f"... cleaned numeric value for {key} = '{strvalue}'")
+            log.debug("... cleaned numeric value for %s = '%s'", key, strvalue)
         else:
-            if self.DEBUG_OUTPUT:
-                print(f"... cleaned string value for {key}  = '{strvalue}'")
+            log.debug("... cleaned string value for %s  = '%s'", key, strvalue)
 
         if self.default_to_zero and strvalue == "":
             strvalue = "0.0"
@@ -326,23 +463,24 @@ class MiraRegion:
         return strvalue
     # end clean_num_value()
 
-    def process_numeric_values(self) -> dict:
+    def process_numeric_values(self, text: str = None) -> dict:
+        """
+        Retrieves and parses the values of the region.
+        :param text: Text already retrieved via process_and_retrieve(), if None
+                     the region gets processed now
+        :return: Dictionary of keys and values
+        """
         # Return data set
         data = {}
 
-        # Do we have a secondary key?
-        if 'additionalKeys' in self.regionConfig:
-            if isinstance(self.regionConfig['additionalKeys'], list):
-                keys = [self.key] + self.regionConfig['additionalKeys']
-            else:
-                keys = [self.key] + [self.regionConfig['additionalKeys']]
-        else:
-            keys = [self.key]
+        # Region key followed by the additional keys
+        keys = self.spec.keys
 
         # Retrieve and split text from region
-        text = self.process_and_retrieve()
+        if text is None:
+            text = self.process_and_retrieve()
         if len(keys) > 1:
-            texts = re.split(self.value_separators, text)
+            texts = self.value_separators.split(text)
         else:
             texts = [text]
 
@@ -354,16 +492,16 @@ class MiraRegion:
             else:
                 i += 1
 
-        if self.DEBUG_OUTPUT:
-            print("... got text snippets:  [%s]" % '|'.join(texts))
-            print("... got following keys: [%s]" % '|'.join(keys))
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("... got text snippets:  [%s]", '|'.join(texts))
+            log.debug("... got following keys: [%s]", '|'.join(keys))
 
         # Process the text parts
         #i=0
         #for current_text in texts:
         for i in range(len(texts)):
             current_text = texts[i]
-            print("... current key: #%i/%i" % (i, len(keys)))
+            log.debug("... current key: #%i/%i", i, len(keys))
             # Get key for current value
             try:
                 current_key = keys[i]
@@ -371,30 +509,16 @@ class MiraRegion:
                 continue
 
             # Get unit of current value - if present
-            defined_unit = None
-            if 'unit' in self.regionConfig:
-                if isinstance(self.regionConfig['unit'], list):
-                    if len(self.regionConfig['unit']) > i:
-                        defined_unit = self.regionConfig['unit'][i]
-                else:
-                    defined_unit = self.regionConfig['unit']
+            defined_unit = self.spec.units[i]
 
-            if self.DEBUG_OUTPUT:
-                if len(text) > 1:
-                    print(f"... retrieved text after splitting: '{current_text}'")
+            if len(text) > 1:
+                log.debug("... retrieved text after splitting: '%s'", current_text)
 
             # Check for mandatory text entries:
-            if 'MandatoryText' in self.regionConfig:
-                mandatory_texts = []
-                if isinstance(self.regionConfig['MandatoryText'], list):
-                    mandatory_texts = self.regionConfig['MandatoryText']
-                else:
-                    mandatory_texts.append(self.regionConfig['MandatoryText'])
-
-                for t in mandatory_texts:
-                    if t not in current_text:
-                        print(f"... {t} not found for {current_key}")
-                        current_text = ''
+            for t in self.spec.mandatory_text:
+                if t not in current_text:
+                    log.info("... %s not found for %s", t, current_key)
+                    current_text = ''
 
             # Strip text from leading and trailing spaces
             current_text = current_text.strip()
@@ -404,67 +528,30 @@ class MiraRegion:
                 current_text = '0W'
 
             # Workaround for wrongly recognized numbers
-            corrected_text = current_text.replace("A","4")
-            corrected_text = corrected_text.replace("B", "8")
-            corrected_text = corrected_text.replace("D","0")
-            corrected_text = corrected_text.replace("I","1")
-            corrected_text = corrected_text.replace("T", "7")
-            corrected_text = corrected_text.replace("ı", " ")
-#            corrected_text = corrected_text.replace("%", "W")
-
+            corrected_text = current_text.translate(_DIGIT_FIX)
 
             # Extract values (temperature or power)
-            match_temp = re.search(r"(-?\d{1,2},?\d)\s*°C", corrected_text)
-            match_energy = re.search(r"(-?\d+[.,]?\d*)\s*(kWh|kwh|Kwh|KWh|kKWh|mwh|Mwh|MWh)", corrected_text)
-            match_power = re.search(r"(-?\d+[.,]?\d*)\s*(w|W|kW|kw|KW|kkW|kKW)", corrected_text)
-            match_battery = re.search(r"(\d{1,3})\s*\%", corrected_text)
-            match_rps = re.search(r"(\d{1,3})\s*rps", corrected_text)
-
-            if match_temp:
-                value = self.clean_num_value(current_key, match_temp.group(1) + "°C")
-                data[current_key] = value
-                print(f"... Detected temperature: {value}")
-            elif match_battery:
-                value = self.clean_num_value(current_key, match_battery.group(1) + "%")
-                data[current_key] = value
-                print(f"... Detected battery: {value}")
-            elif match_rps:
-                value = self.clean_num_value(current_key, match_rps.group(1) + "rps")
-                data[current_key] = value
-                print(f"... Detected RPS: {value}")
-            elif match_energy:
-                # Correct uper/lower case errors in unit
-                unit = (match_energy.group(2)).replace("w", "W")
-                unit = unit.replace("H", "h")
-                unit = unit.replace("KW", "kW")
-                unit = unit.replace("kKW", "kW")
-                unit = unit.replace("mW", "MW")
-
-                # Get corrected numeric value
-                value = self.clean_num_value(current_key, match_energy.group(1) + unit)
+            match = None
+            for pattern, kind, unit in _VALUE_PATTERNS:
+                match = pattern.search(corrected_text)
+                if match:
+                    break
 
-                data[current_key] = value
-
-                print(f"... Detected energy: {value}")
-            elif match_power:
+            if match:
                 # Correct uper/lower case errors in unit
-                unit = (match_power.group(2)).replace("w", "W")
-                unit = unit.replace("KW", "kW")
-                unit = unit.replace("kw", "kW")
-                unit = unit.replace("kKW", "kW")
+                if unit is None:
+                    unit = _UNIT_FIX.get(match.group(2), match.group(2))
 
                 # Get corrected numeric value
-                value = self.clean_num_value(current_key, match_power.group(1) + unit)
-
+                value = self.clean_num_value(current_key, match.group(1) + unit)
                 data[current_key] = value
-
-                print(f"... Detected power: {value}")
+                log.debug("... Detected %s: %s", kind, value)
             else:
-                if self.DEBUG_OUTPUT:
-                    print(f"... retrieved text: '{current_text}'")
+                log.debug("... retrieved text: '%s'", current_text)
 
                 if defined_unit is not None and defined_unit != 'None':
-                    print(f"... Skipping text value '{current_text}' for value of unit {defined_unit}!")
+                    log.debug("... Skipping text value '%s' for value of unit %s!",
+                              current_text, defined_unit)
 
                     if self.default_to_zero:
                         data[current_key] = '0.0'
@@ -473,75 +560,33 @@ class MiraRegion:
                 else:
                     #data[current_key] = "N/A"
                     data[current_key] = current_text
-                    print(f"... Detected text: {current_text}")
+                    log.debug("... Detected text: %s", current_text)
 
             #i += 1
 
-        if self.DebugDeleteImageAfterSuccess:
-            for key in keys:
-                if key in data:
-                    for f in glob.glob(f"{self.img_prefix}*.png"):
-                        try:
-                            os.remove(f)
-                        except FileNotFoundError:
-                            print(f"File '{f}' could not be deleted.")
+        # Delete the debug images written for this region, no directory scan needed
+        if self.DebugDeleteImageAfterSuccess and self.debug_images and any(key in data for key in keys):
+            for f in self.debug_images:
+                try:
+                    os.unlink(f)
+                except OSError:
+                    log.warning("File '%s' could not be deleted.", f)
+            self.debug_images.clear()
 
         return data
     # end processNumericValues()
 
     def get_auto_discovery_data(self) -> list:
         data = []
-        keys = [self.key]
-
-        # Do we have a secondary key?
-        if 'additionalKeys' in self.regionConfig:
-            keys.append(self.regionConfig['additionalKeys'])
-
-        i=0
-        for k in keys:
-            # Get defaults
-            if 'deviceClass' in self.regionConfig:
-                if isinstance(self.regionConfig['deviceClass'], list):
-                    device_class = self.regionConfig['deviceClass'][i]
-                else:
-                    device_class = self.regionConfig['deviceClass']
-            else:
-                device_class = 'None'
-
-            if 'stateClass' in self.regionConfig:
-                if isinstance(self.regionConfig['stateClass'], list):
-                    state_class = self.regionConfig['stateClass'][i]
-                else:
-                    state_class = self.regionConfig['stateClass']
-            else:
-                state_class = 'measurement'
-
-            if 'unit' in self.regionConfig:
-                if isinstance(self.regionConfig['unit'], list):
-                    unit = self.regionConfig['unit'][i]
-                else:
-                    unit = self.regionConfig['unit']
-            else:
-                unit = 'None'
-
-            if 'valueTemplate' in self.regionConfig:
-                if isinstance(self.regionConfig['valueTemplate'], list):
-                    value_template = self.regionConfig['valueTemplate'][i]
-                else:
-                    value_template = self.regionConfig['valueTemplate']
-            else:
-                value_template = 'None'
 
+        for i, k in enumerate(self.spec.keys):
             data.append({'uniq_id': k,
                          'name': k,
-                         'dev_cla': device_class,
-                         'state_class': state_class,
-                         'unit_of_meas': unit,
-                         'val_tpl': value_template}
+                         'dev_cla': self.spec.device_classes[i],
+                         'state_class': self.spec.state_classes[i],
+                         'unit_of_meas': self.spec.units[i],
+                         'val_tpl': self.spec.value_templates[i]}
                         )
 
-            # Increment counter
-            i += 1
-
         return data
     # end get_auto_discovery_data()
@@ -11,16 +11,27 @@ https://github.com/Schneydr/Mira2mqtt
 @date 2025/11/11
 """
 
+import logging
 import os
 
-from MiraDataCollector import MiraDataCollector
-
 """Debug output"""
-DEBUG_OUTPUT = True
+DEBUG_OUTPUT = False
 
 """Write pre-processed region images used for OCR for debugging purposes"""
 DEBUG_IMAGE_WRITING = False
 
+"""Format of the debug images, 'bmp' is written much faster than 'png'"""
+DEBUG_IMAGE_FORMAT = "png"
+
+# Debug messages are only formatted if DEBUG_OUTPUT is set
+logging.basicConfig(level=logging.DEBUG if DEBUG_OUTPUT else logging.INFO, format='%(message)s')
+
+# The debug image flags are evaluated when MiraDataCollector gets imported
+os.environ["DEBUG_IMAGE_WRITING"] = "1" if DEBUG_IMAGE_WRITING else "0"
+os.environ["DEBUG_IMAGE_FORMAT"] = DEBUG_IMAGE_FORMAT
+
+from MiraDataCollector import MiraDataCollector
+
 """Configuration"""
 CONFIG = {
     # Heat pump connection data
@@ -31,13 +42,52 @@ CONFIG = {
     'OCRLanguage': 'deu',
     'locale': 'de_DE.UTF-8',
 
-    # Path to the tesseract binary
+    # Path to the tesseract binary, only used by the 'pytesseract' OCR engine.
+    # tesserocr links libtesseract directly.
     'TesseractPath': '/usr/bin/tesseract',
 
+    # Directory containing the tesseract language models. The models of
+    # tessdata_fast are considerably faster and sufficient for the Mira UI.
+    # Set to None to use the models installed with tesseract.
+    'OCRDataDir': None,
+
+    # Height in pixels all region images are scaled to before the OCR, None to
+    # keep their size. tesseract works best with text of about 30 to 40 pixels
+    # height. Can be overridden per region by 'targetHeight'.
+    'OCRTargetHeight': None,
+
+    # OCR engine: 'tesserocr' keeps tesseract and its language model loaded
+    # for the whole run, 'pytesseract' starts the tesseract binary for every
+    # text retrieval. Falls back to 'pytesseract' if tesserocr is not installed.
+    'OCREngine': 'tesserocr',
+
+    # Number of threads running the OCR of the regions of a page. Every thread
+    # loads its own language model, so keep it low on small devices.
+    'OCRThreads': 2,
+
+    # Time in seconds between two traversals of the pages. The collector then
+    # keeps running and stays connected to the heat pump and the MQTT broker.
+    # Set to None to traverse the pages only once, e.g. when run by cron.
+    'pollInterval': None,
+
+    # Optionally treat a region as unchanged if a 16x16 thumbnail of it differs
+    # by less than this sum of gray values from the one of its last OCR. Only
+    # meant to filter VNC encoding noise: a changed digit can score below 200,
+    # so keep it low and check it against real frames. 0 disables the check,
+    # regions are then only skipped if their pixels did not change at all.
+    'RegionFingerprintThreshold': 0,
+
+    # File used to keep OCR results between runs, so unchanged screen
+    # regions are not passed to tesseract again. A relative path is relative
+    # to the directory of the collector. Set to None to disable.
+    'OCRCacheFile': 'mira_ocr_cache.json',
+
     # MQTT configuration
     'mqttUsage': True,
     'mqttBroker': '192.168.178.29',
     'mqttPort': 1883,
+    # The broker keeps a persistent session for this client id. Use an empty
+    # id for a random one with a clean session.
     'mqttClientId': 'MiraDataCollector',
     'mqttUser': '',
     'mqttPassword': '',
@@ -81,6 +131,9 @@ CONFIG = {
                 # x and y coordinates
                 {'moveTo': [10,10],
                  # optional list of mandatory text we will check the page content for.
+                 # Instead of a string, an entry can also be a dictionary like
+                 # {'text': 'Statistik', 'coordinates': (0, 0, 300, 60)}
+                 # to only check the given area of the page, which is much faster.
                  'MandatoryText': ['Wärmepumpe','Netz']}
             ],
             # Within the page we now need to define at least one region
@@ -104,8 +157,28 @@ CONFIG = {
                     #   denoise
                     #   thresh -> adaptive thresholding
                     'preProcessing': 'contrast',
-                    # tesseract OCR configuration to enhance data retrieval
+                    # Optional threshold mode of 'thresh': 'adaptive' (default) or
+                    # 'otsu', a much cheaper global threshold which is sufficient
+                    # for regions with a uniform background.
+                    #'thresholdMode': 'otsu',
+                    # Optionally run the OCR on the grayscale image first and skip the
+                    # pre-processing if it already yields a value with unit. Saves the
+                    # pre-processing for clean regions, costs a second OCR otherwise.
+                    #'ocrRawFirst': True,
+                    # Optionally scale the region to this height in pixels before the
+                    # pre-processing, overrides OCRTargetHeight. None keeps the size.
+                    #'targetHeight': 48,
+                    # tesseract OCR configuration to enhance data retrieval.
+                    # Always set the page segmentation mode (--psm), e.g. 6 for a
+                    # block of text or 7 for a single line, so tesseract can skip
+                    # its layout analysis. Regions with numbers and units only may
+                    # skip loading the dictionaries with
+                    # '-c load_system_dawg=0 -c load_freq_dawg=0'.
                     'ocrConfig': '--oem 3 --psm 6',
+                    # Optionally restrict the characters tesseract may recognize, which
+                    # avoids misread letters in numeric regions. Must include the
+                    # characters of the unit, as the unit is used to detect the value.
+                    #'charWhitelist': '0123456789,.-°C',
                     # optional check for decimal places (sometimes the OCR looses th decimal
                     # point) -> value gets corrected by shifting the decimal point
                     'mandatoryDecimalPlaces': 1,
@@ -164,7 +237,7 @@ CONFIG = {
                 'HeatingTemp': {
                     'coordinates': (154, 704, 248, 732),
                     'preProcessing': 'gray',
-                    'ocrConfig': '',
+                    'ocrConfig': '--oem 3 --psm 7',
                     # Home Assistant auto discovery
                     'deviceClass': 'temperature',
                     'unit': '°C',
@@ -207,6 +280,11 @@ CONFIG = {
             }
         },
         'Statistics': {
+            # Optionally, a page is only traversed again after this number of
+            # seconds, in between its last values are published. Pages whose
+            # clicks start on this page (like StatisticsWithDefrosting) need
+            # the same interval.
+            #'refreshInterval': 300,
             # In order to retrieve the data we need, it is sometimes
             # necessary to perform a long sequence of mouse clicks.
             'MouseMovesAndClicks': [
@@ -365,25 +443,16 @@ CONFIG = {
                     'valueTemplate': '{{ value_json.Heating_IST | float | round (1) }}',
                 }
             }
-        },
-        'BackHome': {
-            'MouseMovesAndClicks': [
-                # x and y coordinates
-                {'moveTo': [10, 10],
-                 # optional list of mandatory text we will check the page content for.
-                 'MandatoryText': ['Wärmepumpe','Netz']}
-            ],
-            'Regions': {
-            }
         }
-    }
-}
+    },
 
-os.environ["DEBUG_OUTPUT"] = "1" if DEBUG_OUTPUT else "0"
-os.environ["DEBUG_IMAGE_WRITING"] = "1" if DEBUG_IMAGE_WRITING else "0"
+    # x and y coordinates clicked after the last page to return to the home
+    # page of the Mira UI. The page is neither captured nor checked.
+    # Set to None to stay on the last page.
+    'BackHomeClick': [10, 10],
+}
 
-mira = MiraDataCollector(CONFIG)
-mira.connect_mqtt()
-mira.vnc_connect()
-mira.traverse_pages()
-mira.vnc_disconnect()
+# The collector connects on entering and closes all connections, stops the
+# OCR threads and saves the OCR cache on leaving, also if polling fails
+with MiraDataCollector(CONFIG) as mira:
+    mira.poll(CONFIG.get('pollInterval'))